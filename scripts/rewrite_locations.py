@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Single-pass rewriter for server/routes/locations.ts.
+
+Consolidates update_locations_routes.py, fix_locations_manually.py, and
+final_fix_locations.py, which each re-read the same source and repeated
+overlapping sweeps. This script reads the file once, applies the passes in a
+documented order, and writes once:
+
+1. try/catch stripping for the handlers that carried their own catch mapping,
+2. literal transforms (imports the migration needs),
+3. asyncHandler wrap via one generated regex,
+4. a closing paren on each wrapped route's terminating });,
+5. status -> ApiError rewrites (literal scan; 503 keeps its regex).
+
+The result lands in <name>_rewritten.ts next to each source, written to a
+temp file and moved into place with os.replace so a crash never leaves a
+half-written review file. The originals are untouched. With no arguments the
+script processes server/routes/locations.ts; given several route files it
+rewrites them in parallel, one worker process per file.
+"""
+
+import mmap
+import os
+import re
+import shutil
+import sys
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+ROUTES_FILE = Path(__file__).resolve().parent.parent / 'server' / 'routes' / 'locations.ts'
+
+
+@dataclass(frozen=True)
+class Transform:
+    """A literal find/replace, skipped when skip_if already appears in the file."""
+
+    find: bytes
+    replace: bytes
+    skip_if: bytes
+
+
+# Imports the rewritten handlers rely on; skipped on re-runs once present.
+IMPORT_TRANSFORMS = [
+    Transform(
+        find=b"import { auditLogger } from '../logging/middleware';",
+        replace=(
+            b"import { auditLogger } from '../logging/middleware';\n"
+            b"import { asyncHandler } from '../middleware/errorHandler';"
+        ),
+        skip_if=b"from '../middleware/errorHandler'",
+    ),
+    Transform(
+        find=b"import { asyncHandler } from '../middleware/errorHandler';",
+        replace=(
+            b"import { asyncHandler } from '../middleware/errorHandler';\n"
+            b"import { ApiError } from '../utils/ApiError';"
+        ),
+        skip_if=b"from '../utils/ApiError'",
+    ),
+]
+
+# One generated transform instead of a hand-maintained table of literal pairs:
+# insert asyncHandler( ahead of each route's async handler. Middleware such as
+# auditLogger('...') contains parens, so the lazy .*? (which stays on the
+# registration line) bridges the middleware list. The lookbehind keeps the sub
+# idempotent on already-wrapped handlers.
+_ROUTE_RX = re.compile(rb"(app\.(?:get|post|put|delete)\('/api/[^']+',.*?)(?<!asyncHandler\()\basync \(")
+_ROUTE_REPL = rb'\1asyncHandler(async ('
+
+# Sanity floor for the number of wrapped routes after substitution.
+_EXPECTED_WRAPS = 28
+
+# The status rewrite scans for this code-agnostic prefix once and dispatches
+# on the 3-digit code that follows, so one pass covers every status. Codes
+# without a factory here (201, 503, ...) pass through untouched; 503 is
+# handled separately since it also carries a details field.
+_STATUS_NEEDLE = b'return res.status('
+_STATUS_TAIL = b').json({ error: '
+_STATUS_THROW_OPEN = {
+    b'500': b'throw ApiError.internal(',
+    b'404': b'throw ApiError.notFound(',
+    b'400': b'throw ApiError.badRequest(',
+    b'409': b'throw ApiError.conflict(',
+}
+
+# Compiled once at module load. The 503 object literal spans lines, but the
+# whitespace runs and the captures use disjoint character classes (no \s*
+# against [^']+, and captures cannot cross a newline), so a failed match can
+# never be retried by trading characters between them - the scan stays linear
+# even on degenerate whitespace runs.
+_STATUS_503 = re.compile(
+    rb"return res\.status\(503\)\.json\(\{[ \t\r\n]*"
+    rb"error: '([^'\n]+)',[ \t\r\n]*"
+    rb"details: '([^'\n]+)'[ \t\r\n]*\}\);"
+)
+_STATUS_503_REPL = rb"throw ApiError.serviceUnavailable('\1', '\2');"
+
+# --- try/catch stripping (byte-oriented streaming pass) ---------------------
+
+# Route registrations sit one indent level inside registerLocationRoutes(), so
+# this anchor finds candidate lines without inspecting every line in the file.
+_ANCHOR = b'\n  app.'
+
+# Registration lines whose handlers get their try/catch stripped. One compiled
+# alternation encoding the same 19 method+path pairs as the old prefix tuple,
+# so a candidate line costs a single deterministic scan that bails on the first
+# byte when it cannot match instead of 19 substring tests. Methods stay paired
+# with their paths: e.g. GET /api/resorts/:id is wrap-only and must not match.
+_ROUTE_MARK = re.compile(
+    rb"app\.(?:"
+    rb"get\('/api/venue-types'"
+    rb"|(?:put|delete)\('/api/resorts/:id'"
+    rb"|(?:get|put)\('/api/(?:ships|resorts)/:id/(?:amenities|venues)'"
+    rb"|(?:get|post)\('/api/locations/:id/(?:attractions|lgbt-venues)'"
+    rb"|(?:put|delete)\('/api/locations/:locationId/(?:attractions|lgbt-venues)/:id'"
+    rb")"
+)
+
+# Compiled once at module load; the catch-block scan runs these on every line
+# it skips.
+_STATUS_RX = re.compile(rb'res\.status\((\d{3})\)')
+_ERROR_RX = re.compile(rb"error:\s*['\"]([^'\"]*)['\"]")
+
+# Status code -> preassembled throw prefix for the catch-block responses kept
+# as throws; each hit emits prefix + message + b"');\n" without rebuilding the
+# constant parts per line.
+_THROW_PREFIX = {
+    b'500': b"      throw ApiError.internal('",
+    b'404': b"      throw ApiError.notFound('",
+    b'400': b"      throw ApiError.badRequest('",
+    b'409': b"      throw ApiError.conflict('",
+}
+
+
+_BRACE_RX = re.compile(rb'[{}]')
+
+# Wrap marker used by the already-migrated fast path below; compiled so the
+# count can run directly against the mapped buffer.
+_WRAP_RX = re.compile(re.escape(b'asyncHandler(async ('))
+
+
+def _brace_index(content):
+    """Offset of every brace in the buffer and the nesting depth after it.
+
+    One C-level finditer pass replaces the per-line count('{')/count('}')
+    arithmetic the block scans below would otherwise repeat; block extents then
+    come from a bisect into these arrays instead of re-walking lines.
+    """
+    offsets = []
+    depths = []
+    depth = 0
+    for m in _BRACE_RX.finditer(content):
+        depth += 1 if m.group() == b'{' else -1
+        offsets.append(m.start())
+        depths.append(depth)
+    return offsets, depths
+
+
+def _block_end(offsets, depths, start, target):
+    """Offset just past the first brace at/after start that lands on target depth."""
+    k = bisect_left(offsets, start)
+    while k < len(offsets) and depths[k] != target:
+        k += 1
+    return offsets[k] + 1 if k < len(offsets) else -1
+
+
+def strip_try_catch(content):
+    """Drop the try/catch wrapper from the targeted handlers in one forward pass.
+
+    asyncHandler forwards rejections to the error middleware, so the try goes
+    away and each catch-block status mapping is kept as an ApiError throw.
+    Lines outside the targeted routes are copied through without being scanned.
+
+    Accepts any buffer with bytes-style find/slicing (including mmap), so the
+    scan runs against the OS page cache without materializing a full copy;
+    only the matched windows are sliced out.
+    """
+    n = len(content)
+    offsets, depths = _brace_index(content)
+    # Preallocate the output at input size plus headroom and advance a write
+    # cursor with slice assignment, so filling it never triggers the regrowth
+    # memcpys of repeated += on an empty bytearray. The emitted throws are the
+    # only additions and the stripped wrappers more than pay for them.
+    out = bytearray(n + (n >> 3))
+    w = 0
+    last = 0
+    pos = 0
+    while True:
+        pos = content.find(_ANCHOR, pos)
+        if pos == -1:
+            break
+        line_start = pos + 1
+        if not _ROUTE_MARK.match(content, line_start + 2):
+            pos = line_start
+            continue
+
+        end = w + line_start - last
+        out[w:end] = content[last:line_start]
+        w = end
+        eol = content.find(b'\n', line_start) + 1
+        end = w + eol - line_start
+        out[w:end] = content[line_start:eol]
+        w = end
+
+        # The handler body runs until depth returns below its opening brace.
+        k = bisect_left(offsets, line_start)
+        body_end = _block_end(offsets, depths, offsets[k] + 1, depths[k] - 1)
+        stop = content.find(b'\n', body_end)
+        stop = n if stop == -1 else stop + 1
+
+        i = eol
+        while i < stop:
+            eol = content.find(b'\n', i)
+            eol = n if eol == -1 else eol + 1
+            line = content[i:eol]
+            stripped = line.strip()
+
+            if stripped == b'try {':
+                # The try wrapper goes away; its closing brace belongs to the
+                # catch line, which is skipped below.
+                i = eol
+                continue
+
+            if stripped.startswith(b'} catch'):
+                # The catch block's extent comes straight from the brace index;
+                # its lines are only scanned for status mappings to keep.
+                open_brace = content.find(b'{', i, eol)
+                k = bisect_left(offsets, open_brace)
+                catch_end = _block_end(offsets, depths, open_brace + 1, depths[k] - 1)
+                j = eol
+                while j < catch_end:
+                    je = content.find(b'\n', j)
+                    je = n if je == -1 else je + 1
+                    inner = content[j:je]
+                    sm = _STATUS_RX.search(inner)
+                    prefix = _THROW_PREFIX.get(sm.group(1)) if sm else None
+                    if prefix:
+                        em = _ERROR_RX.search(inner)
+                        if em:
+                            throw = prefix + em.group(1) + b"');\n"
+                            end = w + len(throw)
+                            out[w:end] = throw
+                            w = end
+                    j = je
+                i = content.find(b'\n', catch_end)
+                i = n if i == -1 else i + 1
+                continue
+
+            end = w + len(line)
+            out[w:end] = line
+            w = end
+            i = eol
+
+        last = stop
+        pos = stop
+
+    end = w + n - last
+    out[w:end] = content[last:]
+    del out[end:]
+    return out
+
+
+def apply_transforms(content, transforms):
+    for t in transforms:
+        if t.skip_if and t.skip_if in content:
+            continue
+        # Every transform literal occurs at most once, so maxcount 1 lets
+        # replace stop at the first hit instead of sweeping the remainder of
+        # the buffer for matches that cannot exist. The uniqueness assert is
+        # a debug guard (stripped under -O) against a literal going stale.
+        assert content.count(t.find) <= 1, f'transform literal not unique: {t.find!r}'
+        content = content.replace(t.find, t.replace, 1)
+    return content
+
+
+def close_wrapped_routes(content):
+    """Close the extra paren asyncHandler( opened on every wrapped route.
+
+    Each wrap position from the _ROUTE_RX pass anchors one fix: the arrow
+    body's matching brace comes from the brace index, and the }); terminating
+    that registration becomes }));. Edits are spliced back to front so earlier
+    offsets stay valid. A close that is already )); is left alone, keeping the
+    pass idempotent.
+    """
+    offsets, depths = _brace_index(content)
+    closes = []
+    for m in _WRAP_RX.finditer(content):
+        open_brace = content.find(b'{', m.end())
+        if open_brace == -1:
+            continue
+        k = bisect_left(offsets, open_brace)
+        body_end = _block_end(offsets, depths, open_brace + 1, depths[k] - 1)
+        if body_end != -1 and content.startswith(b');', body_end):
+            closes.append(body_end)
+    out = bytearray(content)
+    for at in reversed(closes):
+        out[at:at] = b')'
+    return bytes(out)
+
+
+def rewrite_statuses(content):
+    """Rewrite every `return res.status(NNN).json({ error: '...' });` to a throw.
+
+    Splitting on the code-agnostic prefix visits the file once for all status
+    codes; the digits after each hit pick the ApiError factory. Everything
+    around the message is a fixed ASCII literal, so the quoted message is
+    recovered by slicing rather than a regex capture.
+    """
+    chunks = content.split(_STATUS_NEEDLE)
+    if len(chunks) == 1:
+        return content
+
+    # Hot loop: bound append hoisted; each match costs a dict lookup, slicing,
+    # and concatenation only.
+    out = [chunks[0]]
+    out_append = out.append
+    msg_at = 3 + len(_STATUS_TAIL)
+    for chunk in chunks[1:]:
+        throw_open = _STATUS_THROW_OPEN.get(chunk[:3])
+        if throw_open is None or not chunk.startswith(_STATUS_TAIL, 3):
+            # A code we keep (201, 503, ...) or not the shape we expect.
+            out_append(_STATUS_NEEDLE + chunk)
+            continue
+        quote = chunk[msg_at : msg_at + 1]
+        if quote not in (b"'", b'"'):
+            # Template literal or variable message; leave as-is.
+            out_append(_STATUS_NEEDLE + chunk)
+            continue
+        end = chunk.find(quote, msg_at + 1)
+        # The close must sit right after the message quote, as the original
+        # regexes required; anything else (a details field, a line break) is
+        # not the fixed shape and passes through untouched.
+        if end == -1 or not chunk.startswith(b' });', end + 1):
+            out_append(_STATUS_NEEDLE + chunk)
+            continue
+        out_append(throw_open + quote + chunk[msg_at + 1 : end] + quote + b');')
+        out_append(chunk[end + 5 :])
+    return b''.join(out)
+
+
+def rewrite_file(path, expected_wraps=1):
+    """Run the full pipeline for one route file; returns the review file path."""
+    out_file = path.with_name(path.stem + '_rewritten.ts')
+
+    # Map the source instead of read(): no up-front str copy or UTF-8 decode of
+    # a buffer that is mostly ASCII passthrough; the scan reads the page cache.
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Fast path for re-runs during dev iteration: when the handlers are
+            # already wrapped and no legacy 500 response remains, every pass
+            # below is a no-op. Two C-level scans decide that, and the source
+            # is copied through unchanged.
+            wrapped = sum(1 for _ in _WRAP_RX.finditer(mm))
+            if wrapped >= expected_wraps and mm.find(b'return res.status(500).json') == -1:
+                shutil.copyfile(path, out_file)
+                print(f'{path.name} already migrated; copied through')
+                return out_file
+            content = strip_try_catch(mm)
+
+    content = apply_transforms(content, IMPORT_TRANSFORMS)
+
+    content = _ROUTE_RX.sub(_ROUTE_REPL, content)
+    wrapped = content.count(b'asyncHandler(async (')
+    assert wrapped >= expected_wraps, f'{path.name}: only {wrapped} handlers wrapped'
+    content = close_wrapped_routes(content)
+
+    content = rewrite_statuses(content)
+    content = _STATUS_503.sub(_STATUS_503_REPL, content)
+
+    tmp = out_file.with_suffix('.ts.tmp')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # One unbuffered write of the finished buffer; memoryview avoids an
+        # extra copy if a slice is ever handed in here.
+        os.write(fd, memoryview(content))
+    finally:
+        os.close(fd)
+    os.replace(tmp, out_file)
+    print(f'Wrote {out_file}')
+    return out_file
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if not args:
+        rewrite_file(ROUTES_FILE, _EXPECTED_WRAPS)
+        return
+
+    paths = [Path(a) for a in args]
+    if len(paths) == 1:
+        rewrite_file(paths[0])
+        return
+
+    # Rewrites of distinct files share nothing but this read-only module, so
+    # one process per file sidesteps the GIL for the CPU-bound passes; the OS
+    # page cache serves each mapped source to its worker.
+    with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as ex:
+        list(ex.map(rewrite_file, paths))
+
+
+if __name__ == '__main__':
+    main()